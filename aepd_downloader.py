@@ -12,38 +12,125 @@
 Descarga automática de resoluciones (PDF) de la AEPD con paginación.
 Autor: (tu nombre)
 Uso:
-  pip install requests beautifulsoup4 tqdm
+  pip install requests beautifulsoup4 lxml tqdm
   python aepd_downloader.py --out ./aepd_pdfs --delay 1.5 --max-pages 0 --resume
 """
 
 import argparse
+import asyncio
+import contextlib
+import functools
 import os
 import re
 import sys
+import threading
 import time
 import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse, unquote
 
+import lxml.html
 import requests
 from bs4 import BeautifulSoup
 from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from urllib3.util import make_headers
 from urllib3.util.retry import Retry
 from tqdm import tqdm
 
+# BeautifulSoup solo se usa en las fichas (HTML más irregular); con el parser C de lxml
+HTML_PARSER = "lxml"
+
+# Filtro de Bloom para las URLs vistas en memoria (opcional); si no está instalado, set()
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:
+    ScalableBloomFilter = None
+
 
 BASE_LIST_URL = "https://www.aepd.es/informes-y-resoluciones/resoluciones"
 HEADERS = {
-    "User-Agent": "Mozilla/5.0 (compatible; AEPD-PDF-Downloader/1.0; +https://example.org/bot)"
+    "User-Agent": "Mozilla/5.0 (compatible; AEPD-PDF-Downloader/1.0; +https://example.org/bot)",
+    "Connection": "keep-alive",
+    # gzip/deflate y, si está instalado el paquete brotli, también br
+    "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
 }
 
 # Patrones útiles
+# Se mantiene como referencia; en el código se usa _looks_pdf (mismo criterio, sin regex)
 PDF_EXT_RE = re.compile(r"\.pdf($|\?)", re.IGNORECASE)
+PDF_SUFFIX_RE = re.compile(r"\.pdf$", re.IGNORECASE)
+PDF_MAGIC = b"%PDF"
+# La cabecera %PDF puede aparecer en cualquier parte del primer KB (BOM, basura previa)
+PDF_MAGIC_WINDOW = 1024
 ID_RE = re.compile(r"([A-Z]{1,4}-\d{3,6}-\d{4})")  # p.ej. PS-00421-2024
 SAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9._\-]+")
+CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# Textos visibles habituales del enlace a la página siguiente
+NEXT_TEXTS = frozenset({"Siguiente", "»", ">>"})
+
+# Descargas simultáneas por defecto (la paginación sigue siendo secuencial)
+CONCURRENCY = 4
+# Hosts con pool propio y conexiones reutilizables por host (acota también los hilos)
+POOL_HOSTS = 16
+POOL_SIZE = 32
+# Bytes leídos de una ficha para buscar el enlace al PDF (se pide con Range)
+FICHA_MAX_BYTES = 128 * 1024
+# Bloques con los que se alimenta el parser de las páginas de la lista
+PAGE_CHUNK_SIZE = 32 * 1024
+# Tamaño de lectura al descargar PDFs y cada cuánto se refresca la barra de progreso
+CHUNK_SIZE = 256 * 1024
+PROGRESS_STEP = 1024 * 1024
+
+# Índice de reanudación (URLs ya descargadas y estado de la paginación)
+STATE_DB = "_state.db"
+LEGACY_STATE_FILE = "_state.json"
+
+# Activado con --debug: muestra estadísticas del pool de conexiones
+DEBUG = False
 
+# Se activa al interrumpir el crawl (Ctrl-C) para que los hilos de descarga paren ya
+STOP = threading.Event()
 
-def new_session(timeout: int = 25) -> requests.Session:
-    """Crea sesión con reintentos y timeouts."""
+
+class CrawlInterrupted(Exception):
+    """Se pidió parar el crawl: la petición o descarga en curso se abandona."""
+
+
+class TokenBucket:
+    """
+    Limitador global de ritmo (token bucket) compartido por todos los hilos.
+    Permite ráfagas de hasta `capacity` tokens y después mantiene `rate` por segundo.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "last", "lock")
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Consume un token y devuelve los segundos que hay que esperar antes de usarlo."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        """Consume un token; duerme (fuera del lock) solo si el cubo está vacío."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+def new_session(timeout: int = 25, bucket: TokenBucket | None = None) -> requests.Session:
+    """Crea sesión con reintentos, timeouts y (opcional) límite de peticiones/segundo."""
     session = requests.Session()
     session.headers.update(HEADERS)
     retries = Retry(
@@ -53,11 +140,15 @@ def new_session(timeout: int = 25) -> requests.Session:
         allowed_methods=frozenset(["GET", "HEAD"]),
         raise_on_status=False,
     )
-    adapter = HTTPAdapter(max_retries=retries, pool_connections=10, pool_maxsize=10)
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE,
+                          pool_block=False)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     # Hack sencillo para timeouts por default
     session.request = _timeouted_request(session.request, timeout=timeout)
+    session.request = _stoppable_request(session.request)
+    if bucket:
+        session.request = _rate_limited_request(session.request, bucket)
     return session
 
 
@@ -69,6 +160,31 @@ def _timeouted_request(request_func, timeout=25):
     return wrapper
 
 
+def _stoppable_request(request_func):
+    def wrapper(method, url, **kwargs):
+        if STOP.is_set():
+            raise CrawlInterrupted()
+        return request_func(method, url, **kwargs)
+    return wrapper
+
+
+def _rate_limited_request(request_func, bucket: TokenBucket):
+    def wrapper(method, url, **kwargs):
+        bucket.acquire()
+        return request_func(method, url, **kwargs)
+    return wrapper
+
+
+def _debug_pool(resp: requests.Response):
+    """Con --debug, indica cuántas conexiones ha abierto el pool (para confirmar keep-alive)."""
+    if not DEBUG:
+        return
+    pool = getattr(resp.raw, "_pool", None)
+    if pool is not None:
+        print(f"    [debug] {pool.host}: {pool.num_connections} conexiones para {pool.num_requests} peticiones")
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_filename(name: str) -> str:
     name = name.strip().replace(" ", "_")
     name = SAFE_CHARS_RE.sub("_", name)
@@ -79,72 +195,101 @@ def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 
+def _looks_pdf(url: str) -> bool:
+    """Equivale a PDF_EXT_RE.search(url): '.pdf' al final o justo antes de '?'."""
+    url = url.lower()
+    return url.endswith(".pdf") or ".pdf?" in url
+
+
 def is_pdf_response(resp: requests.Response) -> bool:
     ctype = (resp.headers.get("Content-Type") or "").lower()
     return "application/pdf" in ctype or ctype.endswith("/pdf")
 
 
-def extract_pdf_links_from_page(soup: BeautifulSoup, base_url: str) -> list[tuple[str, str]]:
+def fetch_page(session: requests.Session, url: str) -> lxml.html.HtmlElement:
     """
-    Devuelve lista [(url_pdf_o_detalle, texto_link)].
-    Incluye candidatos que aparentan ser el enlace a PDF o a la ficha.
+    Descarga una página de la lista y la analiza en streaming: cada bloque se pasa al
+    parser de lxml según llega, sin mantener el HTML completo en memoria.
     """
-    links = []
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        txt = (a.get_text(strip=True) or "")
-        # Preferimos anchors de "Ver documento", IDs tipo PS-xxxxx-YYYY, o que apunten a .pdf
-        if PDF_EXT_RE.search(href) or "Ver documento" in txt or ID_RE.search(txt):
-            links.append((urljoin(base_url, href), txt))
-    # De-duplicar preservando orden
-    seen = set()
-    uniq = []
-    for u, t in links:
-        if u not in seen:
-            uniq.append((u, t))
-            seen.add(u)
-    return uniq
-
-
-def find_next_page_url(soup: BeautifulSoup, current_url: str) -> str | None:
+    with session.get(url, stream=True) as resp:
+        resp.raise_for_status()
+        # Sin charset (o con uno desconocido) en la cabecera, lxml lo detecta del <meta>
+        m = CHARSET_RE.search(resp.headers.get("Content-Type") or "")
+        try:
+            parser = lxml.html.HTMLParser(collect_ids=False, encoding=m.group(1) if m else None)
+        except LookupError:
+            parser = lxml.html.HTMLParser(collect_ids=False)
+        for chunk in resp.raw.stream(PAGE_CHUNK_SIZE, decode_content=True):
+            parser.feed(chunk)
+        return parser.close()
+
+
+def load_page(session: requests.Session, url: str) -> tuple[list[tuple[str, str]], str | None]:
+    """fetch_page + parse_page; se ejecuta entera en un hilo (lxml libera el GIL al analizar)."""
+    return parse_page(fetch_page(session, url), url)
+
+
+def parse_page(doc: lxml.html.HtmlElement, base_url: str) -> tuple[list[tuple[str, str]], str | None]:
     """
-    Intenta localizar la URL de 'siguiente' en la paginación.
-    Busca varios selectores típicos (rel=next, aria-label, texto »/>>/Siguiente).
+    Recorre una sola vez los anchors de una página de la lista y devuelve
+    ([(url_pdf_o_detalle, texto_link)], url_siguiente_o_None).
     """
-    # 1) rel="next"
-    a = soup.select_one('a[rel="next"], a[rel*=next]')
-    if a and a.get("href"):
-        return urljoin(current_url, a["href"])
-
-    # 2) aria-label contenga 'Siguiente'
-    for sel in ['a[aria-label*="Siguiente" i]', 'a[title*="Siguiente" i]']:
-        a = soup.select_one(sel)
-        if a and a.get("href"):
-            return urljoin(current_url, a["href"])
-
-    # 3) por texto visible
-    candidates = [x for x in soup.find_all("a", href=True) if x.get_text(strip=True) in {"Siguiente", "»", ">>"}]
-    if candidates:
-        return urljoin(current_url, candidates[0]["href"])
-
-    # 4) fallback: si hay paginador con números, tomar el siguiente del activo
-    pagers = soup.select("ul.pagination li, nav ul li, .pager li, .pagination li")
+    # dict como set ordenado: de-duplica por URL conservando el primer texto
+    links = {}
+    # Enlace 'siguiente' por prioridad: rel=next, aria-label, title, texto visible
+    nexts = [None, None, None, None]
+    id_search = ID_RE.search
+    for a in doc.iter("a"):
+        href = a.get("href")
+        if href is None:
+            continue
+        txt = a.text_content().strip()
+        # Preferimos anchors de "Ver documento", IDs tipo PS-xxxxx-YYYY, o que apunten a .pdf
+        # (test de .pdf de _looks_pdf en línea: es el bucle más caliente)
+        href_lower = href.lower()
+        if href_lower.endswith(".pdf") or ".pdf?" in href_lower or "Ver documento" in txt or id_search(txt):
+            links.setdefault(urljoin(base_url, href), txt)
+        if not href or nexts[0] is not None:
+            continue
+        if "next" in (a.get("rel") or ""):
+            nexts[0] = href
+        elif nexts[1] is None and "siguiente" in (a.get("aria-label") or "").lower():
+            nexts[1] = href
+        elif nexts[2] is None and "siguiente" in (a.get("title") or "").lower():
+            nexts[2] = href
+        elif nexts[3] is None and txt in NEXT_TEXTS:
+            nexts[3] = href
+
+    href = next((h for h in nexts if h is not None), None)
+    next_url = urljoin(base_url, href) if href else _next_from_pager(doc, base_url)
+    return list(links.items()), next_url
+
+
+def _next_from_pager(doc: lxml.html.HtmlElement, current_url: str) -> str | None:
+    """Fallback: si hay paginador con números, tomar el siguiente del activo."""
+    pagers = doc.xpath(
+        '//ul[contains(concat(" ", normalize-space(@class), " "), " pagination ")]//li'
+        ' | //nav//ul//li'
+        ' | //*[contains(concat(" ", normalize-space(@class), " "), " pager ")]//li'
+        ' | //*[contains(concat(" ", normalize-space(@class), " "), " pagination ")]//li'
+    )
     active_idx = None
     items = []
     for li in pagers:
-        a = li.find("a", href=True)
-        label = (a.get_text(strip=True) if a else li.get_text(strip=True))
+        a = li.find(".//a[@href]")
+        label = (a if a is not None else li).text_content().strip()
         items.append((li, a, label))
-        if "active" in (li.get("class") or []) or label == "1":  # heurística
+        if "active" in (li.get("class") or "").split() or label == "1":  # heurística
             active_idx = len(items) - 1
     if active_idx is not None and active_idx + 1 < len(items):
         _, a, _ = items[active_idx + 1]
-        if a and a.get("href"):
-            return urljoin(current_url, a["href"])
+        if a is not None and a.get("href"):
+            return urljoin(current_url, a.get("href"))
 
     return None
 
 
+@functools.lru_cache(maxsize=4096)
 def pick_file_name(url_or_text: str, content_url: str) -> str:
     """
     Genera nombre de archivo:
@@ -160,13 +305,31 @@ def pick_file_name(url_or_text: str, content_url: str) -> str:
         # 2) tomar nombre de la ruta
         path = unquote(urlparse(content_url).path)
         base = os.path.basename(path) or "documento"
-        base = re.sub(r"\.pdf$", "", base, flags=re.IGNORECASE)
+        base = PDF_SUFFIX_RE.sub("", base)
     base = sanitize_filename(base)
     if not base.lower().endswith(".pdf"):
         base += ".pdf"
     return base
 
 
+def pdf_out_path(out_dir: str, file_name_hint: str, pdf_url: str) -> str:
+    """Ruta local donde download_pdf guardará `pdf_url`."""
+    return os.path.join(out_dir, pick_file_name(file_name_hint, pdf_url))
+
+
+def _find_pdf_link(session: requests.Session, html: bytes, base_url: str) -> str | None:
+    """Devuelve el primer enlace .pdf del HTML que responda como PDF."""
+    soup = BeautifulSoup(html, HTML_PARSER)
+    for a in soup.find_all("a", href=True):
+        href = urljoin(base_url, a["href"])
+        if _looks_pdf(href):
+            # Comprobar que realmente es PDF
+            h = session.head(href, allow_redirects=True)
+            if is_pdf_response(h) or _looks_pdf(h.url):
+                return h.url
+    return None
+
+
 def resolve_pdf_url(session: requests.Session, url: str) -> str | None:
     """
     Dado un candidato (que puede ser PDF directo o una ficha),
@@ -175,163 +338,429 @@ def resolve_pdf_url(session: requests.Session, url: str) -> str | None:
     try:
         # 1) HEAD rápido
         r = session.head(url, allow_redirects=True)
-        if is_pdf_response(r) or PDF_EXT_RE.search(r.url):
+        if is_pdf_response(r) or _looks_pdf(r.url):
             return r.url
 
-        # 2) Si no es PDF, GET de la página y buscar enlaces .pdf
+        # 2) Si no es PDF, leer solo el comienzo de la ficha y buscar enlaces .pdf
+        with session.get(url, allow_redirects=True, stream=True,
+                         headers={"Range": f"bytes=0-{FICHA_MAX_BYTES - 1}"}) as r:
+            if is_pdf_response(r):
+                return r.url
+            html = r.raw.read(FICHA_MAX_BYTES, decode_content=True)
+        pdf_url = _find_pdf_link(session, html, url)
+        if pdf_url or len(html) < FICHA_MAX_BYTES:
+            return pdf_url
+
+        # 3) Ficha truncada sin enlace válido: GET completo
         r = session.get(url, allow_redirects=True)
         if is_pdf_response(r):
             return r.url
-        soup = BeautifulSoup(r.text, "html.parser")
-        for a in soup.find_all("a", href=True):
-            href = urljoin(url, a["href"])
-            if PDF_EXT_RE.search(href):
-                # Comprobar que realmente es PDF
-                h = session.head(href, allow_redirects=True)
-                if is_pdf_response(h) or PDF_EXT_RE.search(h.url):
-                    return h.url
-    except requests.RequestException:
+        return _find_pdf_link(session, r.content, url)
+    except (requests.RequestException, Urllib3HTTPError):
         return None
     return None
 
 
+def _write_all(fd: int, data: bytes):
+    """os.write puede escribir solo parte del buffer: repetir hasta completarlo."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _write_stream(r: requests.Response, tmp_path: str, total: int | None, desc: str, head: bytes = b""):
+    """
+    Vuelca el cuerpo de la respuesta a `tmp_path` con os.write sobre el descriptor
+    (sin la capa de buffer de Python), reservando espacio si se conoce el tamaño.
+    `head` son los bytes ya leídos del stream (se escriben primero).
+    """
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        if total and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, total)
+            except OSError:
+                pass  # el sistema de archivos no lo soporta
+        _write_all(fd, head)
+        n, last_tick = len(head), 0
+        with tqdm(total=total, unit="B", unit_scale=True, desc=desc, leave=False) as pbar:
+            for chunk in r.raw.stream(CHUNK_SIZE, decode_content=True):
+                if STOP.is_set():
+                    raise CrawlInterrupted()
+                _write_all(fd, chunk)
+                n += len(chunk)
+                if n - last_tick >= PROGRESS_STEP:
+                    pbar.update(n - last_tick)
+                    last_tick = n
+            pbar.update(n - last_tick)
+        if total and n != total:
+            # Content-Length no coincide con lo recibido (p.ej. cuerpo comprimido)
+            os.ftruncate(fd, n)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
 def download_pdf(session: requests.Session, pdf_url: str, out_dir: str, file_name_hint: str,
-                 resume: bool = True) -> str | None:
+                 resume: bool = True, validators: dict | None = None) -> str | None:
     """
     Descarga PDF; devuelve ruta local si tuvo éxito.
     Usa el 'hint' para construir un nombre significativo.
+    Si se pasa `validators` ({"etag", "last_modified"}) y el archivo ya existe, hace un
+    GET condicional (304 = sin cambios, se marca con "not_modified"); el dict se actualiza
+    con los de la respuesta.
     """
-    fname = pick_file_name(file_name_hint, pdf_url)
-    out_path = os.path.join(out_dir, fname)
+    out_path = pdf_out_path(out_dir, file_name_hint, pdf_url)
+    fname = os.path.basename(out_path)
 
     if resume and os.path.exists(out_path) and os.path.getsize(out_path) > 0:
         return out_path
 
+    # Los PDF ya vienen comprimidos: sin Content-Encoding, Content-Length es el tamaño real
+    headers = {"Accept-Encoding": "identity"}
+    if validators and os.path.exists(out_path):
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
     try:
-        with session.get(pdf_url, stream=True) as r:
-            if not is_pdf_response(r):
-                # aún así guardar si termina en .pdf (algunos servers no envían content-type correcto)
-                if not PDF_EXT_RE.search(r.url):
-                    return None
+        with session.get(pdf_url, stream=True, headers=headers) as r:
+            if r.status_code == 304:
+                validators["not_modified"] = True
+                return out_path
             r.raise_for_status()
+            # Decide la firma del archivo, no el Content-Type (algunos servers no lo envían bien)
+            prefix = r.raw.read(PDF_MAGIC_WINDOW, decode_content=True)
+            if PDF_MAGIC not in prefix:
+                return None
             total = int(r.headers.get("Content-Length", "0")) or None
             tmp_path = out_path + ".part"
-            with open(tmp_path, "wb") as f, tqdm(
-                total=total, unit="B", unit_scale=True, desc=fname, leave=False
-            ) as pbar:
-                for chunk in r.iter_content(chunk_size=1024 * 64):
-                    if chunk:
-                        f.write(chunk)
-                        pbar.update(len(chunk))
+            _write_stream(r, tmp_path, total, fname, head=prefix)
             os.replace(tmp_path, out_path)
+            if validators is not None:
+                validators.update(etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+            # Cuerpo consumido entero: al salir del with la conexión vuelve al pool
+            _debug_pool(r)
         return out_path
-    except requests.RequestException:
-        # limpiar .part
+    except (requests.RequestException, Urllib3HTTPError, OSError):
+        # limpiar .part (también si falla la escritura, p.ej. disco lleno)
+        _remove_part(out_path)
+        return None
+    except CrawlInterrupted:
+        _remove_part(out_path)
+        raise
+
+
+def _remove_part(out_path: str):
+    try:
+        if os.path.exists(out_path + ".part"):
+            os.remove(out_path + ".part")
+    except OSError:
+        pass
+
+
+def open_state_db(out_dir: str) -> sqlite3.Connection:
+    """Abre (o crea) el índice SQLite de reanudación en la carpeta de salida."""
+    db = sqlite3.connect(os.path.join(out_dir, STATE_DB))
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    with db:
+        db.execute("CREATE TABLE IF NOT EXISTS seen("
+                   "url TEXT PRIMARY KEY, path TEXT, etag TEXT, last_modified TEXT, mtime REAL)")
+        db.execute("CREATE TABLE IF NOT EXISTS kv(key TEXT PRIMARY KEY, value TEXT)")
+        # Índices creados antes de guardar Last-Modified
+        columns = {row[1] for row in db.execute("PRAGMA table_info(seen)")}
+        if "last_modified" not in columns:
+            db.execute("ALTER TABLE seen ADD COLUMN last_modified TEXT")
+    return db
+
+
+def load_state(db: sqlite3.Connection, out_dir: str) -> dict:
+    """Lee next_url/visited_pages del índice (o del antiguo _state.json si aún no hay)."""
+    state = dict(db.execute("SELECT key, value FROM kv"))
+    legacy = os.path.join(out_dir, LEGACY_STATE_FILE)
+    if not state and os.path.exists(legacy):
         try:
-            if os.path.exists(out_path + ".part"):
-                os.remove(out_path + ".part")
-        except OSError:
+            state = json.load(open(legacy, "r", encoding="utf-8"))
+        except Exception:
             pass
-        return None
+    return state
+
+
+def is_downloaded(db: sqlite3.Connection, out_dir: str, url: str) -> bool:
+    """True si la URL figura en el índice y su archivo sigue en disco."""
+    row = db.execute("SELECT path FROM seen WHERE url=?", (url,)).fetchone()
+    return bool(row) and os.path.exists(os.path.join(out_dir, row[0]))
+
+
+def get_validators(db: sqlite3.Connection, url: str) -> dict:
+    """ETag/Last-Modified guardados para la URL (vacío si no hay)."""
+    row = db.execute("SELECT etag, last_modified FROM seen WHERE url=?", (url,)).fetchone()
+    return {"etag": row[0], "last_modified": row[1]} if row else {}
+
+
+def new_seen_filter() -> "set[str] | ScalableBloomFilter":
+    """
+    Conjunto de URLs de PDF ya vistas en esta ejecución. Con pybloom-live usa un Bloom
+    escalable (unos 19-20 bits por URL para 1e-4, más el coste de crecer), mucho menos que
+    guardar cada cadena. Como puede dar falsos positivos (~1/10000), cada acierto se
+    confirma con una consulta exacta (CrawlContext.already_seen) antes de saltar la URL.
+    """
+    if ScalableBloomFilter is None:
+        return set()
+    return ScalableBloomFilter(initial_capacity=10000, error_rate=1e-4)
+
+
+def resolve_candidate(session: requests.Session, url: str) -> str | None:
+    """Resuelve un candidato de la lista a la URL real del PDF (si es ficha)."""
+    if _looks_pdf(url):
+        # Sin HEAD previo: el GET en streaming de download_pdf ya valida la respuesta
+        return url
+    return resolve_pdf_url(session, url)
+
+
+class CrawlContext:
+    """Estado compartido por las tareas de un crawl (solo se usa desde el event loop)."""
+    __slots__ = ("session", "sem", "pace", "db", "seen_pdf_urls", "in_flight", "out_dir", "resume",
+                 "busy_paths", "paths_free")
+
+    def __init__(self, session: requests.Session, sem: asyncio.Semaphore, pace: TokenBucket | None,
+                 db: sqlite3.Connection, seen_pdf_urls: "set[str] | ScalableBloomFilter", out_dir: str,
+                 resume: bool):
+        self.session = session
+        self.sem = sem
+        # Ritmo de --delay: un token por página de listado y otro por candidato
+        self.pace = pace
+        self.db = db
+        self.seen_pdf_urls = seen_pdf_urls
+        # URLs de PDF que se están descargando ahora mismo
+        self.in_flight = set()
+        self.out_dir = out_dir
+        self.resume = resume
+        # Archivos locales con una descarga en curso (dos URLs pueden dar el mismo nombre)
+        self.busy_paths = set()
+        self.paths_free = asyncio.Condition()
+
+    def already_seen(self, pdf_url: str, pending: list) -> bool:
+        """
+        ¿Se procesó ya `pdf_url` en esta ejecución? Un acierto del filtro Bloom se confirma
+        con datos exactos: descargas en curso, las ya hechas en esta página (`pending`) y el
+        índice SQLite (páginas anteriores).
+        """
+        if pdf_url not in self.seen_pdf_urls:
+            return False
+        if isinstance(self.seen_pdf_urls, set):
+            return True
+        if pdf_url in self.in_flight or any(row[0] == pdf_url for row in pending):
+            return True
+        try:
+            return self.db.execute("SELECT 1 FROM seen WHERE url = ?", (pdf_url,)).fetchone() is not None
+        except sqlite3.Error:
+            return True
+
+    async def wait_turn(self):
+        """Espera el turno que marca --delay (no bloquea el event loop)."""
+        if self.pace:
+            await asyncio.sleep(self.pace.reserve())
+
+    async def load_page(self, url: str) -> tuple[list[tuple[str, str]], str | None]:
+        await self.wait_turn()
+        return await asyncio.to_thread(load_page, self.session, url)
+
+    @contextlib.asynccontextmanager
+    async def claim_path(self, path: str):
+        """Reserva `path` para una sola descarga a la vez; si ya está ocupado, espera su turno."""
+        async with self.paths_free:
+            await self.paths_free.wait_for(lambda: path not in self.busy_paths)
+            self.busy_paths.add(path)
+        try:
+            yield
+        finally:
+            async with self.paths_free:
+                self.busy_paths.discard(path)
+                self.paths_free.notify_all()
+
+
+async def _process_candidate(ctx: CrawlContext, url: str, txt: str, pending: list):
+    """
+    Resuelve y descarga un candidato. Las llamadas bloqueantes de `requests`
+    se ejecutan en hilos; el semáforo (ya adquirido al lanzar) se libera al terminar.
+    Las filas para el índice se acumulan en `pending` (se escriben una vez por página).
+    """
+    session, seen_pdf_urls, out_dir = ctx.session, ctx.seen_pdf_urls, ctx.out_dir
+    try:
+        pdf_url = await asyncio.to_thread(resolve_candidate, session, url)
+        if not pdf_url:
+            # No se pudo resolver
+            return
+
+        # El filtro solo se toca desde el event loop: no hace falta lock
+        if ctx.already_seen(pdf_url, pending):
+            return
+        seen_pdf_urls.add(pdf_url)
+
+        validators = get_validators(ctx.db, pdf_url)
+        ctx.in_flight.add(pdf_url)
+        try:
+            # El nombre se reserva aquí, antes de pasar al hilo: no puede haber dos escrituras a la vez
+            async with ctx.claim_path(pdf_out_path(out_dir, txt or pdf_url, pdf_url)):
+                saved = await asyncio.to_thread(download_pdf, session, pdf_url, out_dir, txt or pdf_url,
+                                                ctx.resume, validators)
+        finally:
+            ctx.in_flight.discard(pdf_url)
+        if saved:
+            if validators.pop("not_modified", False):
+                print(f"    = Sin cambios: {os.path.basename(saved)}")
+            else:
+                print(f"    ✓ Guardado: {os.path.basename(saved)}")
+            row = (os.path.basename(saved), validators.get("etag"), validators.get("last_modified"),
+                   os.path.getmtime(saved))
+            pending.extend((u,) + row for u in {url, pdf_url})
+        else:
+            print(f"    ✗ Falló: {pdf_url}")
+    finally:
+        ctx.sem.release()
 
 
-def crawl_all_pdfs(out_dir: str, delay: float, max_pages: int, resume: bool, timeout: int):
+async def _crawl_all_pdfs(out_dir: str, delay: float, rps: float | None, max_pages: int, resume: bool,
+                          timeout: int, workers: int):
     ensure_dir(out_dir)
-    session = new_session(timeout=timeout)
+    STOP.clear()
+    # Un hilo por conexión del pool como máximo: más hilos solo esperarían por socket
+    workers = max(1, min(workers, POOL_SIZE))
+    if rps is not None:
+        # --rps: un único cubo para todas las peticiones (páginas, fichas y PDFs) de todos los hilos
+        bucket = TokenBucket(rps, capacity=workers) if rps > 0 else None
+        pace = None
+    else:
+        # --delay: como el script original, una pausa por página y por candidato (no por petición)
+        bucket = None
+        pace = TokenBucket(1 / delay, capacity=workers) if delay > 0 else None
+    session = new_session(timeout=timeout, bucket=bucket)
+    # +1 hilo para ir cargando la siguiente página mientras se descarga la actual
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers + 1, thread_name_prefix="aepd"))
+    sem = asyncio.Semaphore(workers)
 
     visited_pages = 0
     next_url = BASE_LIST_URL
-    seen_pdf_urls = set()
+    seen_pdf_urls = new_seen_filter()
 
-    # Estado para reanudación simple (última página vista)
-    state_file = os.path.join(out_dir, "_state.json")
-    if resume and os.path.exists(state_file):
-        try:
-            state = json.load(open(state_file, "r", encoding="utf-8"))
-            next_url = state.get("next_url", next_url)
-            visited_pages = state.get("visited_pages", 0)
-        except Exception:
-            pass
+    # Estado para reanudación: URLs descargadas y última página vista
+    db = open_state_db(out_dir)
+    if resume:
+        state = load_state(db, out_dir)
+        next_url = state.get("next_url", next_url)
+        visited_pages = int(state.get("visited_pages", 0))
+
+    ctx = CrawlContext(session, sem, pace, db, seen_pdf_urls, out_dir, resume)
+    try:
+        await _crawl_pages(ctx, next_url, visited_pages, max_pages)
+    except asyncio.CancelledError:
+        # Ctrl-C: asyncio.run espera a los hilos antes de salir; que abandonen lo que hacen
+        STOP.set()
+        raise
+    finally:
+        db.close()
 
+
+def _save_page_state(db: sqlite3.Connection, pending: list, next_url: str | None, visited_pages: int):
+    """Guarda las descargas de la página y, si la hay, la siguiente página (una transacción)."""
+    try:
+        with db:
+            db.executemany("INSERT OR REPLACE INTO seen(url, path, etag, last_modified, mtime) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           pending)
+            if next_url:
+                db.executemany("INSERT OR REPLACE INTO kv(key, value) VALUES (?, ?)",
+                               [("next_url", next_url), ("visited_pages", str(visited_pages))])
+    except sqlite3.Error:
+        pass
+
+
+async def _crawl_pages(ctx: CrawlContext, next_url: str, visited_pages: int, max_pages: int):
+    sem, db, out_dir, resume = ctx.sem, ctx.db, ctx.out_dir, ctx.resume
+    next_page = None
     while next_url:
         visited_pages += 1
         print(f"\n[+] Página {visited_pages}: {next_url}")
 
         try:
-            resp = session.get(next_url)
-            resp.raise_for_status()
-        except requests.RequestException as e:
+            # Si ya se precargó durante la página anterior, solo hay que esperar el resultado
+            candidates, next_candidate = await (next_page or ctx.load_page(next_url))
+        except (requests.RequestException, Urllib3HTTPError) as e:
             print(f"    Error al cargar la página: {e}")
             break
-
-        soup = BeautifulSoup(resp.text, "html.parser")
-        candidates = extract_pdf_links_from_page(soup, next_url)
+        except lxml.etree.LxmlError as e:
+            print(f"    Error al analizar la página: {e}")
+            break
         print(f"    Candidatos en la página: {len(candidates)}")
 
-        for url, txt in candidates:
-            # Resolver a URL de PDF real (si es ficha)
-            pdf_url = url
-            if not PDF_EXT_RE.search(url):
-                pdf_url = resolve_pdf_url(session, url)
-            else:
-                # Confirmar que es PDF válido (con HEAD)
-                try:
-                    h = session.head(url, allow_redirects=True)
-                    if not (is_pdf_response(h) or PDF_EXT_RE.search(h.url)):
-                        pdf_url = resolve_pdf_url(session, url)
-                except requests.RequestException:
-                    pdf_url = resolve_pdf_url(session, url)
-
-            if not pdf_url:
-                # No se pudo resolver
-                continue
+        # Precargar (descarga + análisis en un hilo) la siguiente página en paralelo con los PDFs
+        last_page = not next_candidate or (max_pages and visited_pages >= max_pages)
+        next_page = None if last_page else asyncio.ensure_future(ctx.load_page(next_candidate))
 
-            if pdf_url in seen_pdf_urls:
+        # Lanzar descargas acotadas por el semáforo; el ritmo lo marca --delay (aquí) o --rps (sesión)
+        tasks = []
+        pending = []
+        skipped = 0
+        for url, txt in candidates:
+            if resume and is_downloaded(db, out_dir, url):
+                skipped += 1
                 continue
-            seen_pdf_urls.add(pdf_url)
-
-            saved = download_pdf(session, pdf_url, out_dir, txt or pdf_url, resume=resume)
-            if saved:
-                print(f"    ✓ Guardado: {os.path.basename(saved)}")
-            else:
-                print(f"    ✗ Falló: {pdf_url}")
+            await sem.acquire()
+            await ctx.wait_turn()
+            tasks.append(asyncio.create_task(
+                _process_candidate(ctx, url, txt, pending)))
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # Parar los hilos y dejar en el índice lo que ya terminó en esta página
+            STOP.set()
+            _save_page_state(db, pending, None, visited_pages)
+            raise
+        if skipped:
+            print(f"    Ya descargados (según {STATE_DB}): {skipped}")
 
-            time.sleep(delay)
+        _save_page_state(db, pending, next_candidate, visited_pages)
 
-        # Siguiente página
-        next_candidate = find_next_page_url(soup, next_url)
         if not next_candidate:
             print("[-] No se encontró más paginación. Fin.")
             break
         next_url = next_candidate
 
-        # Guardar estado
-        try:
-            json.dump({"next_url": next_url, "visited_pages": visited_pages},
-                      open(state_file, "w", encoding="utf-8"))
-        except Exception:
-            pass
-
         if max_pages and visited_pages >= max_pages:
             print(f"[-] Se alcanzó el límite de páginas: {max_pages}.")
             break
 
-        # Cortesía adicional entre páginas
-        time.sleep(delay)
+
+def crawl_all_pdfs(out_dir: str, delay: float, max_pages: int, resume: bool, timeout: int,
+                   workers: int = CONCURRENCY, rps: float | None = None):
+    asyncio.run(_crawl_all_pdfs(out_dir, delay, rps, max_pages, resume, timeout, workers))
 
 
 def main():
     parser = argparse.ArgumentParser(description="Descargador de resoluciones (PDF) de la AEPD con paginación.")
     parser.add_argument("--out", default="./aepd_pdfs", help="Carpeta de salida (por defecto ./aepd_pdfs)")
-    parser.add_argument("--delay", type=float, default=1.5, help="Pausa (segundos) entre descargas (default 1.5)")
+    parser.add_argument("--delay", type=float, default=1.5,
+                        help="Pausa media (segundos) entre páginas y entre descargas si no se indica --rps (default 1.5)")
+    parser.add_argument("--rps", type=float, default=None,
+                        help="Peticiones por segundo, compartidas por todos los hilos (0 = sin límite)")
     parser.add_argument("--max-pages", type=int, default=0, help="Máximo de páginas a recorrer (0 = todas)")
     parser.add_argument("--resume", action="store_true", help="No re-descargar existentes y reanudar si hay estado")
     parser.add_argument("--timeout", type=int, default=25, help="Timeout por solicitud en segundos (default 25)")
+    parser.add_argument("--workers", type=int, default=CONCURRENCY,
+                        help=f"Descargas simultáneas (default {CONCURRENCY}, máx. {POOL_SIZE})")
+    parser.add_argument("--debug", action="store_true", help="Mostrar estadísticas de reutilización de conexiones")
     args = parser.parse_args()
 
+    global DEBUG
+    DEBUG = args.debug
+
     print("[!] Aviso: respeta robots.txt y limita el ritmo de peticiones.")
     crawl_all_pdfs(out_dir=args.out, delay=args.delay, max_pages=args.max_pages,
-                   resume=args.resume, timeout=args.timeout)
+                   resume=args.resume, timeout=args.timeout, workers=args.workers, rps=args.rps)
 
 
 if __name__ == "__main__":